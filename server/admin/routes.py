@@ -1,7 +1,9 @@
 import logging
-from typing import Optional
+from typing import Any, Dict, Optional
 from fastapi import APIRouter, HTTPException, status, Depends, Query
+from server.db.connection import run_db
 from server.security.admin_auth import get_current_admin
+from server.security.passwords import run_kdf
 from server.users.repository import (
     get_all_users,
     add_tokens_to_user,
@@ -22,14 +24,17 @@ router = APIRouter(
 @router.get("/users")
 async def list_users(
     min_tokens: Optional[int] = Query(None, description="Show users with at least X tokens"),
+    after_id: int = Query(0, ge=0, description="Only users with an id greater than this (the previous page's next_after_id)"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; omit to list every user"),
     current_admin: str = Depends(get_current_admin)
-):
-    logger.info(f"Admin {current_admin} requested user list (min_tokens={min_tokens})")
-    users = get_all_users(min_tokens=min_tokens)
+) -> Dict[str, Any]:
+    logger.info(f"Admin {current_admin} requested user list (min_tokens={min_tokens}, after_id={after_id}, limit={limit})")
+    users = await run_db(get_all_users, min_tokens=min_tokens, after_id=after_id, limit=limit)
     return {
         "status": "success",
         "count": len(users),
-        "users": users
+        "users": users,
+        "next_after_id": users[-1]["id"] if limit is not None and len(users) == limit else None
     }
 
 
@@ -38,13 +43,13 @@ async def add_tokens(
     user_id: int,
     payload: AddTokensRequest,
     current_admin: str = Depends(get_current_admin)
-):
-    email = str(payload.email)
+) -> Dict[str, Any]:
+    email = payload.email
     credit_card = payload.credit_card
     amount = payload.amount
     
     logger.info(f"Admin {current_admin} attempting to add {amount} tokens to user ID {user_id} (email: {email}, credit_card: {credit_card[:4] if len(credit_card) > 4 else '****'}****)")
-    user_id_by_email = get_user_id_by_email(email)
+    user_id_by_email = await run_db(get_user_id_by_email, email)
     if user_id_by_email is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -57,7 +62,7 @@ async def add_tokens(
             detail=f"Email {email} does not match user ID {user_id}"
         )
     
-    success = add_tokens_to_user(email, amount)
+    success = await run_db(add_tokens_to_user, email, amount)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -77,9 +82,9 @@ async def add_tokens(
 async def delete_user_admin(
     user_id: int,
     current_admin: str = Depends(get_current_admin)
-):
+) -> Dict[str, Any]:
     logger.info(f"Admin {current_admin} attempting to delete user ID {user_id}")
-    current_admin_id = get_user_id_by_email(current_admin)
+    current_admin_id = await run_db(get_user_id_by_email, current_admin)
     if current_admin_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -93,7 +98,7 @@ async def delete_user_admin(
             detail="You cannot delete your own account"
         )
     
-    success = delete_user_by_id(user_id)
+    success = await run_db(delete_user_by_id, user_id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -112,10 +117,10 @@ async def reset_user_password(
     user_id: int,
     payload: UserPasswordUpdateRequest,
     current_admin: str = Depends(get_current_admin)
-):
-    email = str(payload.email)
+) -> Dict[str, Any]:
+    email = payload.email
     logger.info(f"Admin {current_admin} attempting to reset password for user ID {user_id} (email: {email})")
-    user_id_by_email = get_user_id_by_email(email)
+    user_id_by_email = await run_db(get_user_id_by_email, email)
     if user_id_by_email is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -128,7 +133,7 @@ async def reset_user_password(
             detail=f"Email {email} does not match user ID {user_id}"
         )
     
-    success = update_user_password(email, payload.new_password)
+    success = await run_kdf(update_user_password, email, payload.new_password)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -22,12 +22,34 @@ if not JWT_SECRET:
     )
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXP_MINUTES = int(os.getenv("JWT_EXP_MINUTES", "60"))
+REFRESH_TOKEN_EXP_DAYS = int(os.getenv("REFRESH_TOKEN_EXP_DAYS", "14"))
 
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = int(os.getenv("DB_PORT", "5432"))
 DB_NAME = os.getenv("DB_NAME", "")
 DB_USER = os.getenv("DB_USER", "")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
 
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "")
+
+MODEL_CACHE_SIZE = int(os.getenv("MODEL_CACHE_SIZE", "32"))
+PREDICT_MAX_BATCH_SIZE = int(os.getenv("PREDICT_MAX_BATCH_SIZE", "32"))
+PREDICT_BATCH_TIMEOUT_MS = float(os.getenv("PREDICT_BATCH_TIMEOUT_MS", "5"))
+PREDICT_PROCESS_WORKERS = int(os.getenv("PREDICT_PROCESS_WORKERS", "0"))
+USER_ID_CACHE_SIZE = int(os.getenv("USER_ID_CACHE_SIZE", "4096"))
+USER_ID_CACHE_TTL_SECONDS = float(os.getenv("USER_ID_CACHE_TTL_SECONDS", "300"))
+ADMIN_CACHE_TTL_SECONDS = float(os.getenv("ADMIN_CACHE_TTL_SECONDS", "60"))
+MODEL_RECORD_CACHE_TTL_SECONDS = float(os.getenv("MODEL_RECORD_CACHE_TTL_SECONDS", "60"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# bcrypt work factor; each +1 doubles hashing time. Lower-cost hashes are upgraded on the next login;
+# higher-cost ones (e.g. cost 12 from the old gensalt() default) are kept as they are.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "10"))
+PASSWORD_CACHE_SIZE = int(os.getenv("PASSWORD_CACHE_SIZE", "4096"))
+PASSWORD_CACHE_TTL_SECONDS = float(os.getenv("PASSWORD_CACHE_TTL_SECONDS", "300"))
+LOGIN_MAX_FAILURES = int(os.getenv("LOGIN_MAX_FAILURES", "5"))
+LOGIN_LOCKOUT_SECONDS = float(os.getenv("LOGIN_LOCKOUT_SECONDS", "300"))
@@ -1,33 +1,137 @@
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from psycopg2.extensions import connection as _PgConnection
+from psycopg2.extras import RealDictCursor
 from psycopg2.pool import ThreadedConnectionPool
 
-from server.config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
+from server.config import (
+    DB_HOST,
+    DB_PORT,
+    DB_NAME,
+    DB_USER,
+    DB_PASSWORD,
+    DB_STATEMENT_TIMEOUT_MS,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_TIMEOUT_SECONDS
+)
+
+logger = logging.getLogger(__name__)
 
 _pool: ThreadedConnectionPool | None = None
-_MIN_CONN = 1
-_MAX_CONN = 10
+# run_db callers can race to create the pool on first use
+_pool_init_lock = threading.Lock()
+_MAX_CONN = max(DB_POOL_MAX_SIZE, 1)
+# The pool opens this many connections up front, when init_db first uses it at startup
+_MIN_CONN = min(max(DB_POOL_MIN_SIZE, 0), _MAX_CONN)
+# ThreadedConnectionPool raises when exhausted; this makes checkouts wait for a free connection instead
+_pool_slots = threading.BoundedSemaphore(_MAX_CONN)
+_db_executor = ThreadPoolExecutor(max_workers=_MAX_CONN, thread_name_prefix="db")
 
 
-def get_connection():
+class _PooledConnection(_PgConnection):
+    """Connection that remembers which statements were PREPAREd on its session."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+def _get_pool() -> ThreadedConnectionPool:
     global _pool
-    if _pool is None:
-        if not DB_NAME or not DB_USER:
-            raise RuntimeError("Missing DB_NAME or DB_USER. Set DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD in .env")
-        _pool = ThreadedConnectionPool(
-            _MIN_CONN,
-            _MAX_CONN,
-            host=DB_HOST,
-            port=DB_PORT,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-        )
-    return _pool.getconn()
+    if _pool is not None:
+        return _pool
+    with _pool_init_lock:
+        if _pool is None:
+            if not DB_NAME or not DB_USER:
+                raise RuntimeError("Missing DB_NAME or DB_USER. Set DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD in .env")
+            _pool = ThreadedConnectionPool(
+                _MIN_CONN,
+                _MAX_CONN,
+                host=DB_HOST,
+                port=DB_PORT,
+                dbname=DB_NAME,
+                user=DB_USER,
+                password=DB_PASSWORD,
+                connection_factory=_PooledConnection,
+                # Set once per pooled session instead of a SET on every checkout; 0 leaves it unlimited
+                options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}",
+                application_name="ml_trainer_api",
+                # Detect dead peers on idle pooled connections instead of failing on the next checkout
+                keepalives=1,
+                keepalives_idle=30,
+            )
+        return _pool
+
+
+def get_connection():
+    pool = _get_pool()
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT_SECONDS or None):
+        logger.warning(f"Connection pool exhausted: no connection freed within {DB_POOL_TIMEOUT_SECONDS}s (size {_MAX_CONN})")
+        raise RuntimeError("Timed out waiting for a database connection")
+    try:
+        return pool.getconn()
+    except Exception:
+        _pool_slots.release()
+        raise
 
 
 def return_connection(conn):
-    global _pool
-    if _pool is not None and conn is not None:
-        try:
+    if conn is None:
+        return
+    try:
+        if _pool is not None:
             _pool.putconn(conn)
-        except Exception:
-            pass
+    except Exception:
+        pass
+    finally:
+        # Connections checked out before close_pool() still hold a slot
+        _pool_slots.release()
+
+
+def close_pool():
+    global _pool
+    with _pool_init_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking repository call off the event loop, on an executor sized to the connection pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(func, *args, **kwargs))
+
+
+@contextmanager
+def db_cursor(dict_rows: bool = False, autocommit: bool = False):
+    """Check out a pooled connection and yield a cursor; commit on success, roll back on error."""
+    conn = get_connection()
+    try:
+        if autocommit:
+            # Single-statement blocks only: skips the separate BEGIN and COMMIT round trips psycopg2 adds
+            conn.autocommit = True
+        with conn.cursor(cursor_factory=RealDictCursor if dict_rows else None) as cur:
+            yield cur
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if autocommit and not conn.closed:
+            conn.autocommit = False
+        return_connection(conn)
+
+
+def execute_prepared(cur, name: str, sql: str, params: tuple):
+    """Run sql ($1..$n placeholders) as a server-side prepared statement, preparing it once per connection."""
+    conn = cur.connection
+    if name not in conn.prepared:
+        cur.execute(f"PREPARE {name} AS {sql}")
+        conn.prepared.add(name)
+    cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
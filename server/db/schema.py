@@ -19,4 +19,20 @@ CREATE TABLE IF NOT EXISTS ml_model (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     UNIQUE(user_id, model_name)
 );
-"""
\ No newline at end of file
+"""
+
+# Refresh tokens are opaque; only their SHA-256 is stored, and each one is deleted when it is used
+ML_REFRESH_TOKEN_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS ml_refresh_token (
+    token_hash TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES ml_user(id) ON DELETE CASCADE,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ml_refresh_token_user_idx ON ml_refresh_token (user_id);
+"""
+
+# Lets the per-request email lookups (id, password hash, tokens, admin flag) be answered from the index alone
+ML_USER_EMAIL_INDEX_SQL = """
+CREATE UNIQUE INDEX IF NOT EXISTS ml_user_email_covering_idx
+    ON ml_user (email) INCLUDE (id, pwd, tokens, is_admin);
+"""
@@ -1,6 +1,6 @@
 import logging
 from server.db.connection import get_connection, return_connection
-from server.db.schema import ML_USER_TABLE_SQL, ML_MODEL_TABLE_SQL
+from server.db.schema import ML_USER_TABLE_SQL, ML_MODEL_TABLE_SQL, ML_REFRESH_TOKEN_TABLE_SQL, ML_USER_EMAIL_INDEX_SQL
 from server.config import ADMIN_EMAIL, ADMIN_PASSWORD
 from server.security.passwords import hash_password
 
@@ -53,7 +53,16 @@ def init_db():
                 cur.execute("ALTER TABLE ml_user ADD COLUMN IF NOT EXISTS is_admin BOOLEAN NOT NULL DEFAULT FALSE")
             except Exception as e:
                 logger.warning(f"Could not add is_admin column (may already exist): {e}")
+            cur.execute(ML_REFRESH_TOKEN_TABLE_SQL)
         conn.commit()
+        try:
+            # Separate transaction: INCLUDE needs PostgreSQL 11+, and a failure here must not undo the tables
+            with conn.cursor() as cur:
+                cur.execute(ML_USER_EMAIL_INDEX_SQL)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.warning(f"Could not create covering email index: {e}")
         logger.info("Database initialized")
         _ensure_one_admin(conn)
         conn.commit()
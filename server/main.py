@@ -9,6 +9,8 @@ logger = logging.getLogger(__name__)
 try:
     from server.api import register_routers
     from server.init_db import init_db
+    from server.db.connection import close_pool
+    from server.models.batching import shutdown_process_pool
 except RuntimeError as e:
     if "JWT_SECRET" in str(e):
         logger.error("\n" + "="*70)
@@ -42,3 +44,10 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Failed to initialize database on startup: {e}")
         logger.error("Server will continue, but database operations may fail")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    close_pool()
+    shutdown_process_pool()
+    logger.info("Server shutdown: Database connections and prediction workers closed")
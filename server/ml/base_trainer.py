@@ -1,5 +1,10 @@
+import contextlib
 import os
 import json
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 import joblib
 from sklearn.compose import ColumnTransformer
@@ -7,11 +12,33 @@ from sklearn.preprocessing import OneHotEncoder
 from sklearn.pipeline import Pipeline
 from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
 
-from server.config import TRAIN_MODELS_DIR, METRICS_DIR
+from server.config import TRAIN_MODELS_DIR, METRICS_DIR, MODEL_CACHE_SIZE
 from server.logging import get_logger
 
+DENSE_ONEHOT_MAX_CATEGORIES = 32
+
+# Memory-map numpy arrays from the uncompressed .pkl instead of copying them; skipped on Windows,
+# where a mapped file cannot be replaced by a retrain or removed on delete
+_LOAD_MMAP_MODE = None if os.name == "nt" else "r"
+
+# os.umask can only be read by setting it, so read it once at import, before any worker threads start
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# Loaded pipelines keyed by .pkl path -> (mtime_ns, pipeline), least recently used first
+_pipeline_cache: OrderedDict = OrderedDict()
+_pipeline_cache_lock = threading.Lock()
+
+
+def evict_cached_pipeline(model_path: str) -> None:
+    with _pipeline_cache_lock:
+        _pipeline_cache.pop(model_path, None)
+
 
 class BaseTrainer:
+    # dtype numeric feature columns are cast to before fitting; None keeps pandas' defaults
+    FEATURE_DTYPE = None
+
     def __init__(self, model_name: str, **kwargs):
         self.model_name = model_name
         self.model = kwargs.get("model", None)
@@ -19,8 +46,6 @@ class BaseTrainer:
 
         self.train_dir = TRAIN_MODELS_DIR
         self.metrics_dir = METRICS_DIR
-        os.makedirs(self.train_dir, exist_ok=True)
-        os.makedirs(self.metrics_dir, exist_ok=True)
 
     def preprocess_dates(self, df: pd.DataFrame) -> pd.DataFrame:
         date_cols = [col for col in df.columns
@@ -53,17 +78,28 @@ class BaseTrainer:
         X = df[feature_cols]
         y = df[label_col]
 
-        string_cols = X.select_dtypes(include=["object"]).columns.tolist()
-
-        preprocessor = ColumnTransformer(
-            transformers=[("cat", OneHotEncoder(drop="first"), string_cols)],
-            remainder="passthrough",
-        )
-
-        pipeline = Pipeline([
-            ("preprocessor", preprocessor),
-            ("model", self.model)
-        ])
+        string_cols, numeric_cols = [], []
+        for col, dtype in X.dtypes.items():
+            (string_cols if pd.api.types.is_string_dtype(dtype) else numeric_cols).append(col)
+        if not string_cols:
+            # All-numeric: consolidate the per-column blocks (one each from pyarrow's split_blocks) into one
+            # contiguous array up front, so the split and sklearn's validation don't each re-interleave them
+            X = pd.DataFrame(X.to_numpy(dtype=self.FEATURE_DTYPE or np.float64), index=X.index, columns=X.columns)
+        elif self.FEATURE_DTYPE is not None and numeric_cols:
+            X = X.astype({col: self.FEATURE_DTYPE for col in numeric_cols})
+
+        if string_cols:
+            dense = int(X[string_cols].nunique().sum()) <= DENSE_ONEHOT_MAX_CATEGORIES
+            preprocessor = ColumnTransformer(
+                transformers=[("cat", OneHotEncoder(drop="first", sparse_output=not dense), string_cols)],
+                remainder="passthrough",
+            )
+            pipeline = Pipeline([
+                ("preprocessor", preprocessor),
+                ("model", self.model)
+            ])
+        else:
+            pipeline = Pipeline([("model", self.model)])
 
         from sklearn.model_selection import train_test_split
         X_train, X_test, y_train, y_test = train_test_split(
@@ -71,6 +107,11 @@ class BaseTrainer:
         )
 
         pipeline.fit(X_train, y_train)
+        # Stored on the pickled pipeline so predict can build its frame without dtype inference
+        numeric_dtype = np.dtype(self.FEATURE_DTYPE or np.float64).name
+        pipeline.feature_dtypes_ = {
+            col: str(X[col].dtype) if col in string_cols else numeric_dtype for col in feature_cols
+        }
 
         y_pred = pipeline.predict(X_test)
         metrics = {
@@ -82,7 +123,18 @@ class BaseTrainer:
         model_path = os.path.join(self.train_dir, f"{self.model_name}.pkl")
         metrics_path = os.path.join(self.metrics_dir, f"{self.model_name}_metrics.json")
 
-        joblib.dump(pipeline, model_path)
+        # Dump to a temp file and rename so readers never see a partially written model
+        fd, tmp_path = tempfile.mkstemp(dir=self.train_dir, prefix=f".{self.model_name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                joblib.dump(pipeline, f)
+            # mkstemp creates the file as 0600; give it the mode a plain open() would have
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+            os.replace(tmp_path, model_path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
         with open(metrics_path, "w") as f:
             json.dump(metrics, f, indent=4)
 
@@ -90,15 +142,52 @@ class BaseTrainer:
 
         return metrics
 
-    def predict(self, features: dict):
-        if not features:
-            raise ValueError("Features dictionary cannot be empty")
+    def _load_pipeline(self):
         safe_model_name = os.path.basename(self.model_name)
         if safe_model_name != self.model_name:
             raise ValueError(f"Invalid model name: {self.model_name}")
 
         model_path = os.path.join(self.train_dir, f"{safe_model_name}.pkl")
-        if not os.path.exists(model_path):
+        try:
+            mtime = os.stat(model_path).st_mtime_ns
+        except FileNotFoundError:
+            evict_cached_pipeline(model_path)
             raise FileNotFoundError(f"Model not found: {model_path}")
-        model = joblib.load(model_path)
-        return float(model.predict(pd.DataFrame([features]))[0])
+
+        with _pipeline_cache_lock:
+            cached = _pipeline_cache.get(model_path)
+            if cached is not None and cached[0] == mtime:
+                _pipeline_cache.move_to_end(model_path)
+                return cached[1]
+
+        pipeline = joblib.load(model_path, mmap_mode=_LOAD_MMAP_MODE)
+        with _pipeline_cache_lock:
+            _pipeline_cache[model_path] = (mtime, pipeline)
+            _pipeline_cache.move_to_end(model_path)
+            while len(_pipeline_cache) > MODEL_CACHE_SIZE:
+                _pipeline_cache.popitem(last=False)
+        return pipeline
+
+    def predict(self, features: dict):
+        if not features:
+            raise ValueError("Features dictionary cannot be empty")
+        return self.predict_batch([features])[0]
+
+    def predict_batch(self, features_list: list) -> list:
+        if not features_list or not all(features_list):
+            raise ValueError("Features dictionary cannot be empty")
+        pipeline = self._load_pipeline()
+        return self._predict_rows(pipeline, features_list)
+
+    def _predict_rows(self, pipeline, features_list: list) -> list:
+        df = pd.DataFrame(features_list)
+        dtypes = getattr(pipeline, "feature_dtypes_", None)
+        columns = list(dtypes) if dtypes else list(getattr(pipeline, "feature_names_in_", df.columns))
+        missing = [col for col in columns if col not in df.columns]
+        if missing:
+            raise ValueError(f"Missing features: {missing}")
+        # Extra keys are ignored, and sklearn rejects columns in a different order than at fit time
+        df = df[columns]
+        if dtypes:
+            df = df.astype(dtypes)
+        return pipeline.predict(df).astype(float).tolist()
@@ -1,26 +1,66 @@
-import json
 import logging
-from typing import Any, Dict
+import os
+from typing import Any, Dict, List, Optional
+import orjson
 import pandas as pd
 from fastapi import HTTPException, UploadFile
 
+try:
+    # Optional: multithreaded CSV parsing; pandas' parser is used when pyarrow is not installed
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = pacsv = None
+
 logger = logging.getLogger(__name__)
 
 MAX_FILE_SIZE = 50 * 1024 * 1024
+# Above this size the pandas fallback parses in row chunks to cap the tokenizer's working memory
+CHUNKED_READ_MIN_SIZE = 16 * 1024 * 1024
+CSV_CHUNK_ROWS = 100_000
+
+
+def _upload_size(upload_file: UploadFile) -> int:
+    upload_file.file.seek(0, os.SEEK_END)
+    size = upload_file.file.tell()
+    upload_file.file.seek(0)
+    return size
+
+
+def _read_csv(file, size: int, usecols: Optional[List[str]] = None) -> pd.DataFrame:
+    if pacsv is not None:
+        try:
+            convert_options = pacsv.ConvertOptions(include_columns=list(dict.fromkeys(usecols))) if usecols else None
+            table = pacsv.read_csv(file, convert_options=convert_options)
+            # pyarrow infers dates/timestamps; keep them as text like pd.read_csv so preprocess_dates sees the same input
+            for i, field in enumerate(table.schema):
+                if pa.types.is_temporal(field.type):
+                    table = table.set_column(i, field.name, table.column(i).cast(pa.string()))
+            return table.to_pandas(split_blocks=True, self_destruct=True)
+        except (pa.ArrowInvalid, pa.ArrowKeyError) as e:
+            logger.info(f"pyarrow could not parse CSV, falling back to pandas: {e}")
+            file.seek(0)
+    read_kwargs = {}
+    if usecols:
+        # A callable never raises on absent columns, so callers can report them by name
+        wanted = set(usecols)
+        read_kwargs["usecols"] = lambda col: col in wanted
+    if size > CHUNKED_READ_MIN_SIZE:
+        return pd.concat(pd.read_csv(file, chunksize=CSV_CHUNK_ROWS, **read_kwargs), ignore_index=True)
+    return pd.read_csv(file, **read_kwargs)
 
 
-def parse_csv(upload_file: UploadFile) -> pd.DataFrame:
+def parse_csv(upload_file: UploadFile, usecols: Optional[List[str]] = None) -> pd.DataFrame:
     try:
-        contents = upload_file.file.read()
-        if not contents:
+        size = _upload_size(upload_file)
+        if size == 0:
             raise HTTPException(status_code=400, detail="CSV file is empty")
-        if len(contents) > MAX_FILE_SIZE:
+        if size > MAX_FILE_SIZE:
             raise HTTPException(
                 status_code=400,
                 detail=f"CSV file too large. Maximum size is {MAX_FILE_SIZE / (1024*1024):.0f}MB"
             )
-        upload_file.file.seek(0)
-        df = pd.read_csv(upload_file.file)
+        df = _read_csv(upload_file.file, size, usecols)
         if df.empty:
             raise HTTPException(status_code=400, detail="CSV file has no data")
         return df
@@ -35,8 +75,8 @@ def parse_csv(upload_file: UploadFile) -> pd.DataFrame:
 
 def parse_json_param(param: str, param_name: str) -> Any:
     try:
-        return json.loads(param)
-    except json.JSONDecodeError:
+        return orjson.loads(param)
+    except orjson.JSONDecodeError:
         if param_name == "feature_cols":
             if isinstance(param, str) and not param.startswith('['):
                 return [col.strip() for col in param.split(',') if col.strip()]
@@ -46,19 +86,21 @@ def parse_json_param(param: str, param_name: str) -> Any:
         )
 
 
+_TYPE_CONVERTERS = {
+    "int": int,
+    "bool": lambda v: (
+        v.lower() in ("true", "1", "yes") if isinstance(v, str)
+        else bool(v)
+    ),
+    "float": float,
+    "str": str,
+}
+
+
 def convert_parameter_type(value: Any, expected_type: Any) -> Any:
     if isinstance(expected_type, dict):
         expected_type = expected_type.get("type", "str")
-    type_converters = {
-        "int": lambda v: int(v),
-        "bool": lambda v: (
-            v.lower() in ("true", "1", "yes") if isinstance(v, str)
-            else bool(v)
-        ),
-        "float": lambda v: float(v),
-        "str": lambda v: str(v),
-    }
-    converter = type_converters.get(expected_type)
+    converter = _TYPE_CONVERTERS.get(expected_type)
     if converter is None:
         return str(value)
     return converter(value)
@@ -66,22 +108,20 @@ def convert_parameter_type(value: Any, expected_type: Any) -> Any:
 
 def validate_optional_params(trainer_cls, params: Dict[str, Any]) -> Dict[str, Any]:
     allowed_params = getattr(trainer_cls, "OPTIONAL_PARAMS", {})
-    invalid_keys = [k for k in params.keys() if k not in allowed_params]
-    if invalid_keys:
+    if params.keys() - allowed_params.keys():
+        invalid_keys = [k for k in params if k not in allowed_params]
         raise HTTPException(
             status_code=400,
             detail=f"Invalid optional parameter(s): {invalid_keys}"
         )
     converted_params = {}
-    for key in params:
-        if key in allowed_params:
-            expected_type = allowed_params[key]
-            value = params[key]
-            try:
-                converted_params[key] = convert_parameter_type(value, expected_type)
-            except (ValueError, TypeError) as e:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Invalid type for parameter '{key}': expected {expected_type}, got {type(value).__name__}. Error: {str(e)}"
-                )
+    for key, value in params.items():
+        expected_type = allowed_params[key]
+        try:
+            converted_params[key] = convert_parameter_type(value, expected_type)
+        except (ValueError, TypeError) as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid type for parameter '{key}': expected {expected_type}, got {type(value).__name__}. Error: {str(e)}"
+            )
     return converted_params
@@ -1,7 +1,20 @@
+import numpy as np
 from sklearn.linear_model import LinearRegression
 from server.ml.base_trainer import BaseTrainer
 
 
+def _check_finite(X: np.ndarray) -> None:
+    # float conversion turns None into NaN, which sklearn would have rejected
+    if not np.isfinite(X).all():
+        raise ValueError("Input X contains NaN or infinity")
+
+
+def _predict_row(features: dict, columns: list, coef: np.ndarray, intercept: float) -> float:
+    x = np.fromiter((features[col] for col in columns), dtype=float, count=len(columns))
+    _check_finite(x)
+    return float(x @ coef + intercept)
+
+
 class LinearRegressionModel(BaseTrainer):
     OPTIONAL_PARAMS = {
         "fit_intercept": "bool",
@@ -10,3 +23,19 @@ class LinearRegressionModel(BaseTrainer):
     def __init__(self, model_name: str = "linear_regression", fit_intercept: bool = True, **kwargs):
         model = LinearRegression(fit_intercept=fit_intercept)
         super().__init__(model_name, model=model, **kwargs)
+
+    def _predict_rows(self, pipeline, features_list: list) -> list:
+        # All-numeric models have no preprocessor: y = X @ coef + intercept, without a DataFrame round-trip
+        if "preprocessor" in pipeline.named_steps:
+            return super()._predict_rows(pipeline, features_list)
+        model = pipeline.named_steps["model"]
+        columns = list(model.feature_names_in_)
+        for features in features_list:
+            missing = [col for col in columns if col not in features]
+            if missing:
+                raise ValueError(f"Missing features: {missing}")
+        if len(features_list) == 1:
+            return [_predict_row(features_list[0], columns, model.coef_, model.intercept_)]
+        X = np.array([[features[col] for col in columns] for features in features_list], dtype=float)
+        _check_finite(X)
+        return (X @ model.coef_ + model.intercept_).tolist()
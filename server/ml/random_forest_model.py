@@ -1,8 +1,11 @@
+import numpy as np
 from sklearn.ensemble import RandomForestRegressor
 from server.ml.base_trainer import BaseTrainer
 
 
 class RandomForestModel(BaseTrainer):
+    # Trees split on float32 internally; casting up front avoids a hidden copy in fit
+    FEATURE_DTYPE = np.float32
     OPTIONAL_PARAMS = {
         "n_estimators": "int",
         "max_depth": "int",
@@ -25,5 +28,7 @@ class RandomForestModel(BaseTrainer):
             max_depth=max_depth_arg,
             min_samples_split=min_samples_split,
             min_samples_leaf=min_samples_leaf,
+            n_jobs=-1,
+            random_state=42,
         )
         super().__init__(model_name, model=model, **kwargs)
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from server.config import PREDICT_MAX_BATCH_SIZE, PREDICT_BATCH_TIMEOUT_MS, PREDICT_PROCESS_WORKERS
+from server.ml.base_trainer import BaseTrainer
+
+logger = logging.getLogger(__name__)
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _predict_in_worker(trainer_cls, model_name: str, features_list: list) -> list:
+    # Runs in a pool process; each worker keeps its own pipeline cache
+    return trainer_cls(model_name=model_name).predict_batch(features_list)
+
+
+async def _predict_rows(trainer: BaseTrainer, features_list: list) -> list:
+    global _process_pool
+    if PREDICT_PROCESS_WORKERS <= 0:
+        return await run_in_threadpool(trainer.predict_batch, features_list)
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=PREDICT_PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_process_pool, _predict_in_worker, type(trainer), trainer.model_name, features_list)
+
+
+def shutdown_process_pool() -> None:
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+class PredictionBatcher:
+    """Coalesces concurrent predictions for the same model into one predict_batch call."""
+
+    def __init__(self, max_batch_size: int, timeout_ms: float):
+        self.max_batch_size = max_batch_size
+        self.timeout = timeout_ms / 1000
+        self._pending: Dict[Tuple, List[Tuple[dict, asyncio.Future]]] = {}
+        self._tasks = set()
+
+    async def predict(self, model_name: str, trainer: BaseTrainer, features: dict) -> float:
+        if self.max_batch_size <= 1:
+            return (await _predict_rows(trainer, [features]))[0]
+
+        # Rows only share a batch when their feature keys match, so a missing column
+        # still fails its own request instead of becoming NaN in a combined frame
+        key = (model_name, tuple(features))
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = []
+            self._spawn(self._flush_after_timeout(key, batch, trainer))
+        batch.append((features, future))
+        if len(batch) >= self.max_batch_size and self._take(key, batch):
+            self._spawn(self._run(batch, trainer))
+        return await future
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _take(self, key: Tuple, batch: list) -> bool:
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+            return True
+        return False
+
+    async def _flush_after_timeout(self, key: Tuple, batch: list, trainer: BaseTrainer):
+        await asyncio.sleep(self.timeout)
+        if self._take(key, batch):
+            await self._run(batch, trainer)
+
+    async def _run(self, batch: list, trainer: BaseTrainer):
+        try:
+            results = await _predict_rows(trainer, [features for features, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                _set_exception(batch[0][1], e)
+                return
+            logger.warning(f"Batch prediction of {len(batch)} rows failed for {trainer.model_name}, retrying per row: {e}")
+            for features, future in batch:
+                try:
+                    _set_result(future, (await _predict_rows(trainer, [features]))[0])
+                except Exception as row_error:
+                    _set_exception(future, row_error)
+            return
+        if len(batch) > 1:
+            logger.debug(f"Predicted a batch of {len(batch)} rows for {trainer.model_name}")
+        for (_, future), result in zip(batch, results):
+            _set_result(future, result)
+
+
+def _set_result(future: asyncio.Future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, error: Exception):
+    if not future.done():
+        future.set_exception(error)
+
+
+prediction_batcher = PredictionBatcher(PREDICT_MAX_BATCH_SIZE, PREDICT_BATCH_TIMEOUT_MS)
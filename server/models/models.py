@@ -0,0 +1,51 @@
+from typing import Any, Dict, List, Optional
+
+from fastapi import Form, HTTPException
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator
+
+from server.ml.helpers import parse_json_param
+
+
+class CreateModelForm(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+
+    model_type: str
+    feature_cols: List[str]
+    label_col: str
+    train_percentage: float = 0.8
+    optional_params: Dict[str, Any] = {}
+    model_filename: Optional[str] = None
+
+    @field_validator("feature_cols", mode="before")
+    @classmethod
+    def _parse_feature_cols(cls, value):
+        # Accepts a JSON list or a comma-separated string; lists pass through untouched
+        return parse_json_param(value, "feature_cols") if isinstance(value, str) else value
+
+    @field_validator("optional_params", mode="before")
+    @classmethod
+    def _parse_optional_params(cls, value):
+        return parse_json_param(value, "optional_params") if isinstance(value, str) else value
+
+    @classmethod
+    def as_form(
+        cls,
+        model_type: str = Form(...),
+        feature_cols: str = Form(...),
+        label_col: str = Form(...),
+        train_percentage: float = Form(0.8),
+        optional_params: str = Form("{}"),
+        model_filename: Optional[str] = Form(None),
+    ) -> "CreateModelForm":
+        try:
+            return cls(
+                model_type=model_type,
+                feature_cols=feature_cols,
+                label_col=label_col,
+                train_percentage=train_percentage,
+                optional_params=optional_params,
+                model_filename=model_filename,
+            )
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            raise HTTPException(status_code=400, detail=f"Invalid form data: {errors}")
@@ -1,36 +1,44 @@
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 import logging
+import os
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import Json
 
-from server.db.connection import get_connection, return_connection
+from server.cache import TTLCache
+from server.config import TRAIN_MODELS_DIR, METRICS_DIR, USER_ID_CACHE_SIZE, MODEL_RECORD_CACHE_TTL_SECONDS
+from server.db.connection import db_cursor, execute_prepared
+from server.ml.base_trainer import evict_cached_pipeline
 
 logger = logging.getLogger(__name__)
 
+_INSERT_MODEL_PREPARED = (
+    "INSERT INTO ml_model (user_id, model_name, model_type, file_path, feature_cols) "
+    "VALUES ($1, $2, $3, $4, $5) RETURNING id"
+)
+_METRICS_EXT = "_metrics.json"
 
-def create_model_record(user_id: int, model_name: str, model_type: str, file_path: str, feature_cols: str) -> Optional[int]:
+# model_name -> (owner email, user_id, record) for found models; names embed the owner's id, so the
+# email is re-checked on a hit rather than being part of the key, which lets deletes evict by name
+_model_record_cache = TTLCache(USER_ID_CACHE_SIZE, MODEL_RECORD_CACHE_TTL_SECONDS)
+
+
+def evict_model_record(model_name: str) -> None:
+    _model_record_cache.pop(model_name)
+
+
+def create_model_record(user_id: int, model_name: str, model_type: str, file_path: str, feature_cols: List[str]) -> Optional[int]:
     try:
-        conn = get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "INSERT INTO ml_model (user_id, model_name, model_type, file_path, feature_cols) VALUES (%s, %s, %s, %s, %s) RETURNING id",
-                    (user_id, model_name, model_type, file_path, feature_cols)
-                )
-                model_id = cur.fetchone()[0]
-                conn.commit()
-                logger.info(f"Model record created: {model_name} (user {user_id})")
-                return model_id
-        except psycopg2.IntegrityError:
-            conn.rollback()
-            logger.warning(f"Model name {model_name} already exists for user {user_id}")
-            return None
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"Error creating model record: {e}")
-            raise
-        finally:
-            return_connection(conn)
+        with db_cursor() as cur:
+            execute_prepared(
+                cur, "insert_ml_model", _INSERT_MODEL_PREPARED,
+                (user_id, model_name, model_type, file_path, Json(feature_cols))
+            )
+            model_id = cur.fetchone()[0]
+        logger.info(f"Model record created: {model_name} (user {user_id})")
+        return model_id
+    except psycopg2.IntegrityError:
+        logger.warning(f"Model name {model_name} already exists for user {user_id}")
+        return None
     except Exception as e:
         logger.error(f"Error creating model record: {e}")
         return None
@@ -38,17 +46,12 @@ def create_model_record(user_id: int, model_name: str, model_type: str, file_pat
 
 def get_user_models(user_id: int) -> List[Dict]:
     try:
-        conn = get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(
-                    "SELECT id, model_name, model_type, file_path, feature_cols, created_at FROM ml_model WHERE user_id=%s ORDER BY created_at DESC",
-                    (user_id,)
-                )
-                models = cur.fetchall()
-                return [dict(model) for model in models]
-        finally:
-            return_connection(conn)
+        with db_cursor(dict_rows=True, autocommit=True) as cur:
+            cur.execute(
+                "SELECT id, model_name, model_type, file_path, feature_cols, created_at FROM ml_model WHERE user_id=%s ORDER BY created_at DESC",
+                (user_id,)
+            )
+            return [dict(model) for model in cur.fetchall()]
     except Exception as e:
         logger.error(f"Error fetching models for user {user_id}: {e}")
         return []
@@ -56,60 +59,74 @@ def get_user_models(user_id: int) -> List[Dict]:
 
 def get_model_by_name(user_id: int, model_name: str) -> Optional[Dict]:
     try:
-        conn = get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(
-                    "SELECT id, model_name, model_type, file_path, feature_cols, created_at FROM ml_model WHERE user_id=%s AND model_name=%s",
-                    (user_id, model_name)
-                )
-                model = cur.fetchone()
-                return dict(model) if model else None
-        finally:
-            return_connection(conn)
+        with db_cursor(dict_rows=True, autocommit=True) as cur:
+            cur.execute(
+                "SELECT id, model_name, model_type, file_path, feature_cols, created_at FROM ml_model WHERE user_id=%s AND model_name=%s",
+                (user_id, model_name)
+            )
+            model = cur.fetchone()
+            return dict(model) if model else None
     except Exception as e:
         logger.error(f"Error fetching model {model_name} for user {user_id}: {e}")
         return None
 
 
-def delete_model(user_id: int, model_name: str) -> bool:
-    import os
-    from server.config import METRICS_DIR
-    
+def get_model_for_user_email(email: str, model_name: str) -> Tuple[Optional[int], Optional[Dict]]:
+    """Resolve the user and their model in one query: (None, None) if no such user, (user_id, None) if no such model."""
+    cached = _model_record_cache.get(model_name)
+    if cached is not None and cached[0] == email:
+        return cached[1], dict(cached[2])
     try:
-        model_record = get_model_by_name(user_id, model_name)
-        if model_record is None:
-            return False
-        file_path = model_record.get("file_path")
-        if file_path and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-                logger.info(f"Deleted model file: {file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to delete model file {file_path}: {e}")
-        metrics_path = os.path.join(METRICS_DIR, f"{model_name}_metrics.json")
-        if os.path.exists(metrics_path):
-            try:
-                os.remove(metrics_path)
-                logger.info(f"Deleted metrics file: {metrics_path}")
-            except Exception as e:
-                logger.warning(f"Failed to delete metrics file {metrics_path}: {e}")
-        conn = get_connection()
+        with db_cursor(dict_rows=True, autocommit=True) as cur:
+            cur.execute(
+                "SELECT u.id AS user_id, m.id, m.model_name, m.model_type, m.file_path, m.feature_cols, m.created_at "
+                "FROM ml_user u LEFT JOIN ml_model m ON m.user_id = u.id AND m.model_name = %s "
+                "WHERE u.email = %s",
+                (model_name, email)
+            )
+            row = cur.fetchone()
+        if row is None:
+            return None, None
+        row = dict(row)
+        user_id = row.pop("user_id")
+        if row["id"] is None:
+            return user_id, None
+        _model_record_cache.set(model_name, (email, user_id, dict(row)))
+        return user_id, row
+    except Exception as e:
+        logger.error(f"Error fetching model {model_name} for {email}: {e}")
+        return None, None
+
+
+def remove_model_files(model_name: str, file_path: Optional[str] = None) -> None:
+    model_path = file_path or os.path.join(TRAIN_MODELS_DIR, f"{model_name}.pkl")
+    evict_cached_pipeline(model_path)
+    paths = [model_path, os.path.join(METRICS_DIR, model_name + _METRICS_EXT)]
+    for path in paths:
         try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "DELETE FROM ml_model WHERE user_id=%s AND model_name=%s RETURNING id",
-                    (user_id, model_name)
-                )
-                deleted = cur.rowcount
-                conn.commit()
-                return deleted > 0
-        except Exception as e:
-            conn.rollback()
-            raise
-        finally:
-            return_connection(conn)
+            os.remove(path)
+            logger.info(f"Deleted model file: {path}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to delete model file {path}: {e}")
+
+
+def delete_model(user_id: int, model_name: str) -> Optional[bool]:
+    """True if deleted, False if the user has no such model, None on a database error."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "DELETE FROM ml_model WHERE user_id=%s AND model_name=%s RETURNING file_path",
+                (user_id, model_name)
+            )
+            row = cur.fetchone()
+        evict_model_record(model_name)
+        if row is None:
+            return False
+        remove_model_files(model_name, row[0])
+        return True
     except Exception as e:
         logger.error(f"Error deleting model {model_name} for user {user_id}: {e}")
-        return False
+        return None
 
@@ -1,4 +1,5 @@
-import json
+import asyncio
+import hashlib
 import logging
 import os
 import re
@@ -6,45 +7,89 @@ from datetime import datetime
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 
-from fastapi import APIRouter, HTTPException, Request, UploadFile, File, Form, Depends, status
+import orjson
+import pandas as pd
+from fastapi import APIRouter, HTTPException, Request, Response, UploadFile, File, Depends, status
 from fastapi.concurrency import run_in_threadpool
 from sklearn.utils._param_validation import InvalidParameterError
 
-from server.config import TRAIN_MODELS_DIR, METRICS_DIR
+from server.config import TRAIN_MODELS_DIR
 from server.ml import MODEL_CLASSES
 from server.ml.base_trainer import BaseTrainer
-from server.ml.helpers import parse_csv, parse_json_param, validate_optional_params
-from server.security.jwt_auth import get_current_user
-from server.users.repository import check_and_deduct_tokens, get_user_id_by_email, refund_tokens
-from server.models.repository import create_model_record, get_user_models, get_model_by_name, delete_model
+from server.ml.helpers import parse_csv, validate_optional_params
+from server.db.connection import run_db
+from server.security.jwt_auth import CurrentUser, get_current_user, get_current_user_id
+from server.users.repository import check_and_deduct_tokens, refund_tokens
+from server.models.repository import (
+    create_model_record,
+    get_user_models,
+    get_model_for_user_email,
+    delete_model,
+    remove_model_files
+)
+from server.models.batching import prediction_batcher
+from server.models.models import CreateModelForm
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["models"])
 
+_UNSAFE_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_-]')
 
-@router.get("/models")
-async def get_models() -> Dict[str, Dict[str, Any]]:
-    return {name: {"params": getattr(cls, "OPTIONAL_PARAMS", {})} for name, cls in sorted(MODEL_CLASSES.items())}
 
+# The model catalogue only changes with a deploy, so it is serialized once at import
+_MODELS_PAYLOAD: Dict[str, Dict[str, Any]] = {
+    name: {"params": getattr(cls, "OPTIONAL_PARAMS", {})} for name, cls in sorted(MODEL_CLASSES.items())
+}
+_MODELS_BODY = orjson.dumps(_MODELS_PAYLOAD)
 
-@router.get("/trained")
-async def get_trained_models(current_user: str = Depends(get_current_user)) -> List[str]:
-    user_id = get_user_id_by_email(current_user)
-    if user_id is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    
-    models = get_user_models(user_id)
+
+def _etag(body: bytes) -> str:
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+_MODELS_ETAG = _etag(_MODELS_BODY)
+
+
+def _json_or_not_modified(request: Request, body: bytes, etag: str, **headers) -> Response:
+    # Clients that send back the ETag they already hold get an empty 304 instead of the body
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, **headers})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag, **headers})
+
+
+@router.get("/models", response_model=Dict[str, Dict[str, Any]])
+async def get_models(request: Request) -> Response:
+    return _json_or_not_modified(request, _MODELS_BODY, _MODELS_ETAG)
+
+
+def _models_with_files(models: List[Dict]) -> List[str]:
+    # One directory listing instead of a stat() per model record
+    existing = {entry.path for entry in os.scandir(TRAIN_MODELS_DIR) if entry.is_file()}
     valid_model_names = []
     for model in models:
         file_path = model.get("file_path")
-        if file_path and os.path.exists(file_path):
+        if file_path and (os.path.normpath(file_path) in existing
+                          or (os.path.dirname(os.path.normpath(file_path)) != TRAIN_MODELS_DIR and os.path.exists(file_path))):
             valid_model_names.append(model["model_name"])
         else:
             logger.warning(f"Model {model['model_name']} has database record but file not found at {file_path}")
+    return valid_model_names
+
+
+@router.get("/trained", response_model=List[str])
+async def get_trained_models(request: Request, user: CurrentUser = Depends(get_current_user_id)) -> Response:
+    current_user, user_id = user
+    models = await run_db(get_user_models, user_id)
+    valid_model_names = await run_in_threadpool(_models_with_files, models)
     
     logger.info(f"User {current_user} retrieved {len(valid_model_names)} trained model(s) (out of {len(models)} in database)")
-    return valid_model_names
+    # The list is per user and changes on create/delete, so the ETag comes from the content itself
+    body = orjson.dumps(valid_model_names)
+    return _json_or_not_modified(request, body, _etag(body), **{"Cache-Control": "private, no-cache"})
 
 
 @router.get("/trained/{model_name}")
@@ -52,18 +97,15 @@ async def get_model_details(
     model_name: str,
     current_user: str = Depends(get_current_user)
 ) -> Dict[str, Any]:
-    user_id = get_user_id_by_email(current_user)
-    if user_id is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-
-    safe_model_name = re.sub(r'[^a-zA-Z0-9_-]', '', model_name)
-    if safe_model_name != model_name:
+    if _UNSAFE_NAME_CHARS.search(model_name):
         raise HTTPException(
             status_code=400,
             detail=f"Invalid model name: contains illegal characters"
         )
-    
-    model_record = get_model_by_name(user_id, safe_model_name)
+
+    user_id, model_record = await run_db(get_model_for_user_email, current_user, model_name)
+    if user_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     if model_record is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -82,10 +124,10 @@ async def get_model_details(
         feature_cols_str = feature_cols_str.strip()
         if feature_cols_str and feature_cols_str != '':
             try:
-                feature_cols = json.loads(feature_cols_str)
+                feature_cols = orjson.loads(feature_cols_str)
                 if not isinstance(feature_cols, list):
                     feature_cols = []
-            except (json.JSONDecodeError, TypeError):
+            except (orjson.JSONDecodeError, TypeError):
                 feature_cols = []
     if not feature_cols:
         logger.warning(f"Model {model_name} has no feature_cols stored (may be an older model)")
@@ -101,27 +143,24 @@ async def get_model_details(
 @router.delete("/delete/{model_name}")
 async def delete_model_endpoint(
     model_name: str,
-    current_user: str = Depends(get_current_user)
+    user: CurrentUser = Depends(get_current_user_id)
 ):
-    safe_model_name = re.sub(r'[^a-zA-Z0-9_-]', '', model_name)
-    if safe_model_name != model_name:
+    current_user, user_id = user
+    if _UNSAFE_NAME_CHARS.search(model_name):
         raise HTTPException(
             status_code=400,
             detail=f"Invalid model name: contains illegal characters"
         )
     
-    user_id = get_user_id_by_email(current_user)
-    if user_id is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found"        )
-    model_record = get_model_by_name(user_id, model_name)
-    if model_record is None:
+    logger.info(f"User {current_user} (ID: {user_id}) deleting model: {model_name}")
+    # The DELETE is scoped to the caller's id, so it doubles as the ownership check
+    deleted = await run_db(delete_model, user_id, model_name)
+    if deleted is False:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Model '{model_name}' not found or you don't have access to it"
         )
-    logger.info(f"User {current_user} (ID: {user_id}) deleting model: {model_name}")
-    success = delete_model(user_id, model_name)
-    if not success:
+    if deleted is None:
         logger.error(f"Model deletion failed: {model_name} for user {user_id}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -132,56 +171,67 @@ async def delete_model_endpoint(
     return {"status": "success", "message": f"Model '{model_name}' deleted successfully"}
 
 
-@router.post("/create")
-async def create_model(
-    model_type: str = Form(...),
-    feature_cols: str = Form(...),
-    label_col: str = Form(...),
-    train_percentage: float = Form(0.8),
-    csv_file: Optional[UploadFile] = File(None),
-    optional_params: str = Form("{}"),
-    model_filename: Optional[str] = Form(None),
-    current_user: str = Depends(get_current_user)
-):
-    TRAINING_TOKEN_COST = 1
-    if csv_file is None:
-        raise HTTPException(status_code=400, detail="CSV file missing")
-    if not (0 < train_percentage < 1):
-        raise HTTPException(status_code=400, detail="train_percentage must be between 0 and 1")
-
-    df = await run_in_threadpool(parse_csv, csv_file)
-    feature_cols_list = parse_json_param(feature_cols, "feature_cols")
-    optional_params_dict = parse_json_param(optional_params, "optional_params")
-    if not feature_cols_list or len(feature_cols_list) == 0:
-        raise HTTPException(status_code=400, detail="feature_cols cannot be empty")
-    missing_cols = [c for c in feature_cols_list + [label_col] if c not in df.columns]
+def _parse_training_csv(csv_file: UploadFile, feature_cols_list: List[str], label_col: str) -> pd.DataFrame:
+    # Parsing and the column/NaN scans all touch the whole frame, so they run together off the event loop
+    df = parse_csv(csv_file, feature_cols_list + [label_col])
+    csv_cols = set(df.columns)
+    missing_cols = [c for c in feature_cols_list + [label_col] if c not in csv_cols]
     if missing_cols:
         raise HTTPException(status_code=400, detail=f"Columns not found in CSV: {missing_cols}")
 
-    # Validate data: no missing values in label column or selected feature columns
-    if df[label_col].isna().any():
+    # Validate data: no missing values in label column or selected feature columns (one pass over the frame)
+    checked_cols = [label_col] + feature_cols_list
+    has_na = df[checked_cols].isna().to_numpy().any(axis=0)
+    if has_na[0]:
         raise HTTPException(
             status_code=400,
             detail=f"Label column '{label_col}' contains missing values. Please clean your data before training."
         )
-    feature_na = df[feature_cols_list].isna().any()
-    cols_with_na = [col for col, has_na in feature_na.items() if has_na]
+    cols_with_na = [col for col, col_has_na in zip(feature_cols_list, has_na[1:]) if col_has_na]
     if cols_with_na:
         raise HTTPException(
             status_code=400,
             detail=f"Feature column(s) {cols_with_na} contain missing values. Please clean or impute them before training."
         )
+    return df
+
+
+async def _undo_training(current_user: str, model_name: str, model_path: Optional[str], token_cost: int) -> None:
+    # Compensates a failed create: drop the files a finished training left behind, then give the tokens back
+    if model_path:
+        await run_in_threadpool(remove_model_files, model_name, model_path)
+    if await run_db(refund_tokens, current_user, token_cost):
+        logger.info(f"Refunded {token_cost} tokens to {current_user} due to training failure")
+
+
+@router.post("/create")
+async def create_model(
+    # Declared first so an unknown user is rejected before the form's JSON fields are decoded
+    user: CurrentUser = Depends(get_current_user_id),
+    form: CreateModelForm = Depends(CreateModelForm.as_form),
+    csv_file: Optional[UploadFile] = File(None)
+):
+    TRAINING_TOKEN_COST = 1
+    current_user, user_id = user
+    model_type, label_col, train_percentage = form.model_type, form.label_col, form.train_percentage
+    feature_cols_list, optional_params_dict = form.feature_cols, form.optional_params
+    model_filename = form.model_filename
+    if csv_file is None:
+        raise HTTPException(status_code=400, detail="CSV file missing")
+    if not (0 < train_percentage < 1):
+        raise HTTPException(status_code=400, detail="train_percentage must be between 0 and 1")
+
+    if not feature_cols_list:
+        raise HTTPException(status_code=400, detail="feature_cols cannot be empty")
+    df = await run_in_threadpool(_parse_training_csv, csv_file, feature_cols_list, label_col)
 
     if model_type not in MODEL_CLASSES:
         raise HTTPException(status_code=400, detail=f"Model type '{model_type}' not recognized")
 
     trainer_cls = MODEL_CLASSES[model_type]
     valid_optional_params = validate_optional_params(trainer_cls, optional_params_dict)
-    user_id = get_user_id_by_email(current_user)
-    if user_id is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     if model_filename:
-        safe_name = re.sub(r'[^a-zA-Z0-9_-]', '_', model_filename)
+        safe_name = _UNSAFE_NAME_CHARS.sub('_', model_filename)
         safe_name = safe_name.strip('_')
         if not safe_name:
             raise HTTPException(status_code=400, detail="Invalid model filename")
@@ -193,15 +243,12 @@ async def create_model(
     tokens_deducted = False
     model_path = None
     try:
-        check_and_deduct_tokens(current_user, TRAINING_TOKEN_COST)
+        await run_db(check_and_deduct_tokens, current_user, TRAINING_TOKEN_COST)
         tokens_deducted = True
         trainer = trainer_cls(model_name=model_name, **valid_optional_params)
         metrics = await run_in_threadpool(trainer.train, df, feature_cols_list, label_col, train_percentage)
         model_path = str(Path(TRAIN_MODELS_DIR) / f"{model_name}.pkl")
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Model file was not saved to expected path: {model_path}")
-        feature_cols_json = json.dumps(feature_cols_list)
-        model_id = create_model_record(user_id, model_name, model_type, model_path, feature_cols_json)
+        model_id = await run_db(create_model_record, user_id, model_name, model_type, model_path, feature_cols_list)
         if model_id is None:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
@@ -213,57 +260,13 @@ async def create_model(
             f"MAE={metrics.get('mean_absolute_error', 0):.4f}; saved to {model_path}"
         )
         
-    except HTTPException:
-        if tokens_deducted and model_path and os.path.exists(model_path):
-            try:
-                os.remove(model_path)
-                logger.info(f"Removed orphaned model file: {model_path}")
-            except OSError as err:
-                logger.warning(f"Could not remove orphaned model file {model_path}: {err}")
-            metrics_path = os.path.join(METRICS_DIR, f"{model_name}_metrics.json")
-            if os.path.exists(metrics_path):
-                try:
-                    os.remove(metrics_path)
-                    logger.info(f"Removed orphaned metrics file: {metrics_path}")
-                except OSError as err:
-                    logger.warning(f"Could not remove orphaned metrics file {metrics_path}: {err}")
-        if tokens_deducted:
-            if refund_tokens(current_user, TRAINING_TOKEN_COST):
-                logger.info(f"Refunded {TRAINING_TOKEN_COST} tokens to {current_user} due to training failure")
-        raise
-    except InvalidParameterError as e:
-        if tokens_deducted and model_path and os.path.exists(model_path):
-            try:
-                os.remove(model_path)
-                logger.info(f"Removed orphaned model file: {model_path}")
-            except OSError as err:
-                logger.warning(f"Could not remove orphaned model file {model_path}: {err}")
-            metrics_path = os.path.join(METRICS_DIR, f"{model_name}_metrics.json")
-            if os.path.exists(metrics_path):
-                try:
-                    os.remove(metrics_path)
-                except OSError:
-                    pass
-        if tokens_deducted:
-            if refund_tokens(current_user, TRAINING_TOKEN_COST):
-                logger.info(f"Refunded {TRAINING_TOKEN_COST} tokens to {current_user} due to training failure")
-        raise HTTPException(status_code=400, detail=f"Invalid model parameter: {e}")
     except Exception as e:
-        if tokens_deducted and model_path and os.path.exists(model_path):
-            try:
-                os.remove(model_path)
-                logger.info(f"Removed orphaned model file: {model_path}")
-            except OSError as err:
-                logger.warning(f"Could not remove orphaned model file {model_path}: {err}")
-            metrics_path = os.path.join(METRICS_DIR, f"{model_name}_metrics.json")
-            if os.path.exists(metrics_path):
-                try:
-                    os.remove(metrics_path)
-                except OSError:
-                    pass
         if tokens_deducted:
-            if refund_tokens(current_user, TRAINING_TOKEN_COST):
-                logger.info(f"Refunded {TRAINING_TOKEN_COST} tokens to {current_user} due to training failure")
+            await _undo_training(current_user, model_name, model_path, TRAINING_TOKEN_COST)
+        if isinstance(e, HTTPException):
+            raise
+        if isinstance(e, InvalidParameterError):
+            raise HTTPException(status_code=400, detail=f"Invalid model parameter: {e}")
         logger.exception("Training failed")
         raise HTTPException(status_code=500, detail=f"Training failed: {e}")
 
@@ -282,24 +285,28 @@ async def predict_model(
     model_name: str,
     request: Request,
     current_user: str = Depends(get_current_user)
-):
+) -> Dict[str, Any]:
     PREDICTION_TOKEN_COST = 5
-    safe_model_name = re.sub(r'[^a-zA-Z0-9_-]', '', model_name)
-    if safe_model_name != model_name:
+    if _UNSAFE_NAME_CHARS.search(model_name):
         raise HTTPException(
             status_code=400,
             detail=f"Invalid model name: contains illegal characters"
         )
-    user_id = get_user_id_by_email(current_user)
+    (user_id, model_record), raw_body = await asyncio.gather(
+        run_db(get_model_for_user_email, current_user, model_name),
+        request.body(),
+    )
     if user_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    model_record = get_model_by_name(user_id, model_name)
     if model_record is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Model '{model_name}' not found or you don't have access to it"
         )
-    body = await request.json()
+    try:
+        body = orjson.loads(raw_body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Request body must be valid JSON")
     features = body.get("features")
     if not features:
         raise HTTPException(status_code=400, detail="Missing 'features' in request body")
@@ -308,23 +315,23 @@ async def predict_model(
     logger.info(f"Prediction request: model={model_name}, user={current_user}, features={len(features)}")
     tokens_deducted = False
     try:
-        check_and_deduct_tokens(current_user, PREDICTION_TOKEN_COST)
+        await run_db(check_and_deduct_tokens, current_user, PREDICTION_TOKEN_COST)
         tokens_deducted = True
         trainer = trainer_cls(model_name=model_name)
-        prediction = trainer.predict(features)
+        prediction = await prediction_batcher.predict(model_name, trainer, features)
         logger.info(f"Prediction successful: model={model_name}, user={current_user}, prediction={prediction:.4f}")
         return {"status": "success", "prediction": prediction, "tokens_deducted": PREDICTION_TOKEN_COST}
     except HTTPException:
-        if tokens_deducted and refund_tokens(current_user, PREDICTION_TOKEN_COST):
+        if tokens_deducted and await run_db(refund_tokens, current_user, PREDICTION_TOKEN_COST):
             logger.info(f"Refunded {PREDICTION_TOKEN_COST} tokens to {current_user} due to prediction failure")
         raise
     except FileNotFoundError:
-        if tokens_deducted and refund_tokens(current_user, PREDICTION_TOKEN_COST):
+        if tokens_deducted and await run_db(refund_tokens, current_user, PREDICTION_TOKEN_COST):
             logger.info(f"Refunded {PREDICTION_TOKEN_COST} tokens to {current_user} due to prediction failure (model file not found)")
         logger.exception("Prediction failed: model file not found")
         raise HTTPException(status_code=404, detail=f"Model file not found: {model_name}")
     except Exception as e:
-        if tokens_deducted and refund_tokens(current_user, PREDICTION_TOKEN_COST):
+        if tokens_deducted and await run_db(refund_tokens, current_user, PREDICTION_TOKEN_COST):
             logger.info(f"Refunded {PREDICTION_TOKEN_COST} tokens to {current_user} due to prediction failure")
         logger.exception("Prediction failed")
         raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
@@ -1,27 +1,43 @@
 import logging
+import time
+from typing import NamedTuple
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from datetime import datetime, timedelta, timezone
 import jwt
 from jwt.exceptions import ExpiredSignatureError, InvalidTokenError
-from server.config import JWT_SECRET, JWT_ALGORITHM, JWT_EXP_MINUTES
+from server.cache import TTLCache
+from server.config import JWT_SECRET, JWT_ALGORITHM, JWT_EXP_MINUTES, TOKEN_CACHE_SIZE
+from server.db.connection import run_db
+from server.users.repository import get_user_id_by_email
 
 logger = logging.getLogger(__name__)
 bearer_scheme = HTTPBearer(auto_error=False)
 
+# Raw token -> subject email, kept until the token's own expiry so repeat requests skip the signature check
+_token_cache = TTLCache(TOKEN_CACHE_SIZE, JWT_EXP_MINUTES * 60)
+_ALGORITHMS = [JWT_ALGORITHM]
+
+
+class CurrentUser(NamedTuple):
+    email: str
+    user_id: int
+
 
 def create_jwt(email: str, expires_minutes: int = JWT_EXP_MINUTES) -> str:
-    now = datetime.now(timezone.utc)
-    expire = now + timedelta(minutes=expires_minutes)
-    payload = {"sub": email, "exp": expire, "iat": now}
+    # PyJWT stores exp/iat as whole epoch seconds either way, so skip the datetime round trip
+    now = int(time.time())
+    payload = {"sub": email, "exp": now + expires_minutes * 60, "iat": now}
     token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
     logger.debug(f"JWT token created for: {email} (expires in {expires_minutes} minutes)")
     return token
 
 
 def decode_jwt(token: str) -> str:
+    email = _token_cache.get(token)
+    if email is not None:
+        return email
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = jwt.decode(token, JWT_SECRET, algorithms=_ALGORITHMS)
         email = payload.get("sub")
         if email is None:
             logger.warning("JWT token validation failed: missing subject")
@@ -30,6 +46,8 @@ def decode_jwt(token: str) -> str:
                 detail="Invalid token: missing subject"
             )
         logger.debug(f"JWT token validated for: {email}")
+        if "exp" in payload:
+            _token_cache.set(token, email, ttl=payload["exp"] - time.time())
         return email
     except ExpiredSignatureError:
         logger.warning("JWT token validation failed: token expired")
@@ -61,3 +79,11 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(b
             headers={"WWW-Authenticate": "Bearer"},
         )
     return decode_jwt(credentials.credentials)
+
+
+async def get_current_user_id(email: str = Depends(get_current_user)) -> CurrentUser:
+    """Authenticated user with their id, resolved once per request (FastAPI caches dependencies per request)."""
+    user_id = await run_db(get_user_id_by_email, email)
+    if user_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return CurrentUser(email, user_id)
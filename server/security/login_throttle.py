@@ -0,0 +1,22 @@
+from typing import Tuple
+
+from server.cache import TTLCache
+from server.config import LOGIN_MAX_FAILURES, LOGIN_LOCKOUT_SECONDS
+
+_MAX_TRACKED = 100_000
+
+# (email, client ip) -> consecutive failed logins. Every failure restarts the window, so a key stays
+# blocked until it has been quiet for LOGIN_LOCKOUT_SECONDS. Only touched from the event loop thread.
+_failures = TTLCache(_MAX_TRACKED if LOGIN_MAX_FAILURES > 0 else 0, LOGIN_LOCKOUT_SECONDS)
+
+
+def is_login_blocked(key: Tuple[str, str]) -> bool:
+    return LOGIN_MAX_FAILURES > 0 and (_failures.get(key) or 0) >= LOGIN_MAX_FAILURES
+
+
+def record_login_failure(key: Tuple[str, str]) -> None:
+    _failures.set(key, (_failures.get(key) or 0) + 1)
+
+
+def clear_login_failures(key: Tuple[str, str]) -> None:
+    _failures.pop(key)
@@ -1,8 +1,38 @@
+import asyncio
 import bcrypt
+import functools
+import hashlib
+import hmac
 import logging
+import os
+import re
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+
+from server.cache import TTLCache
+from server.config import BCRYPT_ROUNDS, PASSWORD_CACHE_SIZE, PASSWORD_CACHE_TTL_SECONDS
 
 logger = logging.getLogger(__name__)
 
+# Full modular-crypt bcrypt hash: $2a$/$2b$/$2y$, two-digit cost, 53 chars of salt + digest
+_BCRYPT_HASH_RE = re.compile(r"\$2[aby]\$\d\d\$[./A-Za-z0-9]{53}")
+
+# Successful checks keyed by HMAC(password | stored hash) under a per-process random key, so repeat
+# logins skip bcrypt while the cache never holds anything usable outside this process. The stored
+# hash is part of the key, so a password change simply stops matching; failures are never cached.
+_PROCESS_KEY = secrets.token_bytes(32)
+_verified_cache = TTLCache(PASSWORD_CACHE_SIZE, PASSWORD_CACHE_TTL_SECONDS)
+
+# bcrypt releases the GIL, so one thread per core runs hashes in parallel without crowding
+# out the DB executor or FastAPI's default threadpool
+_kdf_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="kdf")
+
+
+async def run_kdf(func, *args, **kwargs):
+    """Run a call that hashes or verifies a password on the dedicated bcrypt executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_kdf_executor, functools.partial(func, *args, **kwargs))
+
 
 def _truncate_to_bytes(password: str, max_bytes: int = 72) -> bytes:
     if isinstance(password, bytes):
@@ -22,7 +52,7 @@ def hash_password(plain_password: str) -> str:
         raise ValueError("Password must be at least 4 characters")
     password_bytes = _truncate_to_bytes(plain_password, max_bytes=72)
     try:
-        salt = bcrypt.gensalt()
+        salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
         hashed = bcrypt.hashpw(password_bytes, salt)
         return hashed.decode('utf-8')
     except Exception as e:
@@ -30,18 +60,32 @@ def hash_password(plain_password: str) -> str:
         raise ValueError(f"Failed to hash password: {e}")
 
 
+def is_bcrypt_hash(value: str) -> bool:
+    return bool(value) and _BCRYPT_HASH_RE.fullmatch(value) is not None
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True for a valid bcrypt hash made with a lower cost than BCRYPT_ROUNDS; stronger hashes are kept."""
+    return is_bcrypt_hash(hashed_password) and int(hashed_password[4:6]) < BCRYPT_ROUNDS
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     try:
         if not plain_password or not hashed_password:
             logger.warning("Password verification: empty password or hash")
             return False
-        if not hashed_password.startswith('$2'):
-            logger.warning("Password verification: invalid hash format (doesn't start with $2)")
+        if not is_bcrypt_hash(hashed_password):
+            logger.warning("Password verification: stored value is not a well-formed bcrypt hash")
             return False
         password_bytes = _truncate_to_bytes(plain_password, max_bytes=72)
         hashed_bytes = hashed_password.encode('utf-8')
+        cache_key = hmac.new(_PROCESS_KEY, password_bytes + b"|" + hashed_bytes, hashlib.sha256).digest()
+        if _verified_cache.get(cache_key):
+            return True
         result = bcrypt.checkpw(password_bytes, hashed_bytes)
-        if not result:
+        if result:
+            _verified_cache.set(cache_key, True)
+        else:
             logger.debug("Password verification failed: bcrypt.checkpw returned False")
         return result
     except Exception as e:
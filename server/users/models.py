@@ -1,16 +1,23 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 
 
-class UserCreateRequest(BaseModel):
+class _RequestModel(BaseModel):
+    # Unknown keys are rejected instead of silently dropped; parsed payloads are read-only
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+
+class UserCreateRequest(_RequestModel):
     email: EmailStr
     pwd: str = Field(min_length=4, max_length=72)
 
 
-class UserLoginRequest(BaseModel):
+class UserLoginRequest(_RequestModel):
     email: EmailStr
-    pwd: str
+    # No minimum: a short wrong password is a failed login (401, throttled), not a validation error.
+    # The cap is loose because a bootstrap ADMIN_PASSWORD may exceed 72
+    pwd: str = Field(max_length=1024)
 
-class TokenInfoRequest(BaseModel):
+class TokenInfoRequest(_RequestModel):
     username: str
     credit_card: str
     amount: int
@@ -19,15 +26,18 @@ class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
 
-class UserDeleteRequest(BaseModel):
+class RefreshTokenRequest(_RequestModel):
+    refresh_token: str = Field(min_length=1, max_length=256)
+
+class UserDeleteRequest(_RequestModel):
     user_id: int
 
-class UserPasswordUpdateRequest(BaseModel):
+class UserPasswordUpdateRequest(_RequestModel):
     email: EmailStr
     new_password: str = Field(min_length=4, max_length=72)
 
 
-class AddTokensRequest(BaseModel):
+class AddTokensRequest(_RequestModel):
     email: EmailStr
     credit_card: str
     amount: int = Field(gt=0, description="Amount of tokens to add (must be positive)")
\ No newline at end of file
@@ -1,38 +1,84 @@
-from typing import Optional
+from typing import Optional, Tuple
+import hashlib
 import logging
+import secrets
 import psycopg2
-from psycopg2.extras import RealDictCursor
 from fastapi import HTTPException, status
 
+from server.cache import TTLCache
+from server.config import (
+    USER_ID_CACHE_SIZE,
+    USER_ID_CACHE_TTL_SECONDS,
+    ADMIN_CACHE_TTL_SECONDS,
+    REFRESH_TOKEN_EXP_DAYS
+)
 from server.security.passwords import hash_password, verify_password
-from server.db.connection import get_connection, return_connection
+from server.db.connection import db_cursor, execute_prepared
 
 logger = logging.getLogger(__name__)
 
+# email -> user id; ids never change, so entries only go stale when the user is deleted
+_user_id_cache = TTLCache(USER_ID_CACHE_SIZE, USER_ID_CACHE_TTL_SECONDS)
+# Only confirmed admins are cached, so a stale entry can at worst outlive a deletion by the TTL
+_admin_cache = TTLCache(USER_ID_CACHE_SIZE, ADMIN_CACHE_TTL_SECONDS)
+
+
+_USER_COLUMNS = ("id", "email", "pwd", "tokens", "is_admin")
+_USER_LIST_COLUMNS = ("id", "email", "tokens", "is_admin")
+
+# Per-request lookups, run as server-side prepared statements so Postgres parses and plans them once per connection
+_SELECT_USER_PREPARED = "SELECT id, email, pwd, tokens, is_admin FROM ml_user WHERE email = $1"
+_SELECT_USER_ID_PREPARED = "SELECT id FROM ml_user WHERE email = $1"
+_SELECT_TOKENS_PREPARED = "SELECT tokens FROM ml_user WHERE email = $1"
+_SELECT_IS_ADMIN_PREPARED = "SELECT is_admin FROM ml_user WHERE email = $1"
+_DEDUCT_TOKENS_PREPARED = """
+    WITH u AS (SELECT id, tokens FROM ml_user WHERE email = $1),
+    d AS (
+        UPDATE ml_user m SET tokens = m.tokens - $2
+        FROM u WHERE m.id = u.id AND m.tokens >= $2
+        RETURNING m.tokens
+    )
+    SELECT u.tokens, (SELECT tokens FROM d) FROM u
+"""
+
+
+def _forget_user(email: str) -> None:
+    _user_id_cache.pop(email)
+    _admin_cache.pop(email)
+
+
+def _hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _insert_refresh_token(cur, user_id: int) -> str:
+    token = secrets.token_urlsafe(32)
+    cur.execute(
+        "DELETE FROM ml_refresh_token WHERE user_id = %s AND expires_at <= now()",
+        (user_id,)
+    )
+    cur.execute(
+        "INSERT INTO ml_refresh_token (token_hash, user_id, expires_at) "
+        "VALUES (%s, %s, now() + make_interval(days => %s))",
+        (_hash_refresh_token(token), user_id, REFRESH_TOKEN_EXP_DAYS)
+    )
+    return token
+
 
 def create_user(email: str, pwd: str, tokens: int = 15, is_admin: bool = False) -> bool:
     try:
         pwd_hashed = hash_password(pwd)
-        conn = get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "INSERT INTO ml_user (email, pwd, tokens, is_admin) VALUES (%s, %s, %s, %s) RETURNING id",
-                    (email, pwd_hashed, tokens, is_admin)
-                )
-                new_id = cur.fetchone()[0]
-                conn.commit()
-                logger.info(f"Created user {email} with ID {new_id}")
-            return True
-        except psycopg2.IntegrityError:
-            conn.rollback()
-            logger.warning(f"User {email} already exists")
-            return False
-        except Exception as e:
-            conn.rollback()
-            raise
-        finally:
-            return_connection(conn)
+        with db_cursor() as cur:
+            cur.execute(
+                "INSERT INTO ml_user (email, pwd, tokens, is_admin) VALUES (%s, %s, %s, %s) RETURNING id",
+                (email, pwd_hashed, tokens, is_admin)
+            )
+            new_id = cur.fetchone()[0]
+        logger.info(f"Created user {email} with ID {new_id}")
+        return True
+    except psycopg2.IntegrityError:
+        logger.warning(f"User {email} already exists")
+        return False
     except ValueError as e:
         logger.error(f"Password validation error for {email}: {e}")
         return False
@@ -42,31 +88,21 @@ def create_user(email: str, pwd: str, tokens: int = 15, is_admin: bool = False)
 
 def validate_user(email: str, pwd: str) -> Optional[dict]:
     try:
-        conn = get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("SELECT * FROM ml_user WHERE email=%s", (email,))
-                user = cur.fetchone()
-        finally:
-            return_connection(conn)
-
-        if not user:
+        with db_cursor(autocommit=True) as cur:
+            execute_prepared(cur, "select_user", _SELECT_USER_PREPARED, (email,))
+            row = cur.fetchone()
+
+        if not row:
             logger.warning(f"User not found: {email}")
             return None
-        stored_hash = user["pwd"]
-        if not stored_hash or len(stored_hash) < 10:
-            logger.error(f"Invalid password hash stored for user {email}: hash too short or empty")
-            return None
-        
-        if not stored_hash.startswith('$2'):
-            logger.error(f"Invalid password hash format for user {email}: hash doesn't start with $2 (got: {stored_hash[:10]}...)")
-            return None
-        
-        if verify_password(pwd, stored_hash):
+        user = dict(zip(_USER_COLUMNS, row))
+        if verify_password(pwd, user["pwd"]):
             logger.info(f"User {email} authenticated successfully")
+            # The next request with the new token will need this id anyway
+            _user_id_cache.set(email, user["id"])
             return user
         else:
-            logger.warning(f"Password verification failed for user: {email} (hash format looks valid: {stored_hash[:20]}...)")
+            logger.warning(f"Password verification failed for user: {email}")
             return None
     except Exception as e:
         logger.error(f"Error validating user {email}: {e}")
@@ -74,79 +110,54 @@ def validate_user(email: str, pwd: str) -> Optional[dict]:
 
 def delete_user(email: str) -> bool:
     try:
-        conn = get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute("DELETE FROM ml_user WHERE email=%s RETURNING id", (email,))
-                deleted = cur.rowcount
-                conn.commit()
-                return deleted > 0
-        except Exception as e:
-            conn.rollback()
-            raise
-        finally:
-            return_connection(conn)
+        with db_cursor() as cur:
+            cur.execute("DELETE FROM ml_user WHERE email=%s RETURNING id", (email,))
+            row = cur.fetchone()
+        _forget_user(email)
+        return row is not None
     except Exception as e:
         logger.error(f"Error deleting user {email}: {e}")
         return False
 
 
 def delete_user_by_id(user_id: int) -> bool:
-    import os
-    from server.models.repository import get_user_models
+    from server.models.repository import evict_model_record, remove_model_files
     try:
-        models = get_user_models(user_id)
-        deleted_files = 0
-        
-        for model in models:
-            file_path = model.get("file_path")
-            if file_path and os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    deleted_files += 1
-                    logger.info(f"Deleted model file: {file_path}")
-                except Exception as e:
-                    logger.warning(f"Failed to delete model file {file_path}: {e}")
-            model_name = model.get("model_name")
-            if model_name:
-                from server.config import METRICS_DIR
-                metrics_path = os.path.join(METRICS_DIR, f"{model_name}_metrics.json")
-                if os.path.exists(metrics_path):
-                    try:
-                        os.remove(metrics_path)
-                        logger.info(f"Deleted metrics file: {metrics_path}")
-                    except Exception as e:
-                        logger.warning(f"Failed to delete metrics file {metrics_path}: {e}")
-        conn = get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute("DELETE FROM ml_user WHERE id=%s RETURNING email", (user_id,))
-                result = cur.fetchone()
-                deleted = cur.rowcount
-                conn.commit()
-                if deleted > 0 and result:
-                    logger.info(f"Deleted user with ID {user_id} (email: {result[0]}), removed {deleted_files} model file(s)")
-                return deleted > 0
-        except Exception as e:
-            conn.rollback()
-            raise
-        finally:
-            return_connection(conn)
+        with db_cursor() as cur:
+            # Models go with the user via ON DELETE CASCADE; the join still sees them in the statement's snapshot
+            cur.execute(
+                "WITH deleted AS (DELETE FROM ml_user WHERE id=%s RETURNING id, email) "
+                "SELECT d.email, m.model_name, m.file_path FROM deleted d LEFT JOIN ml_model m ON m.user_id = d.id",
+                (user_id,)
+            )
+            rows = cur.fetchall()
+        if not rows:
+            return False
+        email = rows[0][0]
+        _forget_user(email)
+        models = [(model_name, file_path) for _, model_name, file_path in rows if model_name is not None]
+        for model_name, file_path in models:
+            evict_model_record(model_name)
+            remove_model_files(model_name, file_path)
+        logger.info(f"Deleted user with ID {user_id} (email: {email}) and {len(models)} model(s)")
+        return True
     except Exception as e:
         logger.error(f"Error deleting user with ID {user_id}: {e}")
         return False
 
 
 def get_user_id_by_email(email: str) -> Optional[int]:
+    user_id = _user_id_cache.get(email)
+    if user_id is not None:
+        return user_id
     try:
-        conn = get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT id FROM ml_user WHERE email=%s", (email,))
-                row = cur.fetchone()
-                return row[0] if row else None
-        finally:
-            return_connection(conn)
+        with db_cursor(autocommit=True) as cur:
+            execute_prepared(cur, "select_user_id", _SELECT_USER_ID_PREPARED, (email,))
+            row = cur.fetchone()
+        if row is None:
+            return None
+        _user_id_cache.set(email, row[0])
+        return row[0]
     except Exception as e:
         logger.error(f"Error fetching user ID for {email}: {e}")
         return None
@@ -154,14 +165,10 @@ def get_user_id_by_email(email: str) -> Optional[int]:
 
 def get_user_tokens(email: str) -> Optional[int]:
     try:
-        conn = get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT tokens FROM ml_user WHERE email=%s", (email,))
-                row = cur.fetchone()
-                return row[0] if row else None
-        finally:
-            return_connection(conn)
+        with db_cursor(autocommit=True) as cur:
+            execute_prepared(cur, "select_user_tokens", _SELECT_TOKENS_PREPARED, (email,))
+            row = cur.fetchone()
+        return row[0] if row else None
     except Exception as e:
         logger.error(f"Error fetching tokens for {email}: {e}")
         return None
@@ -170,47 +177,52 @@ def get_user_tokens(email: str) -> Optional[int]:
 def update_user_password(email: str, new_password: str) -> bool:
     try:
         pwd_hashed = hash_password(new_password)
-        conn = get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE ml_user SET pwd=%s WHERE email=%s RETURNING id",
-                    (pwd_hashed, email)
-                )
-                updated = cur.rowcount
-                conn.commit()
-                if updated > 0:
-                    logger.info(f"Password updated for user: {email}")
-                    return True
-                return False
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"Error updating password for {email}: {e}")
-            raise
-        finally:
-            return_connection(conn)
+        with db_cursor() as cur:
+            cur.execute(
+                "UPDATE ml_user SET pwd=%s WHERE email=%s RETURNING id",
+                (pwd_hashed, email)
+            )
+            row = cur.fetchone()
+            if row is not None:
+                # Sessions started with the old password must log in again
+                cur.execute("DELETE FROM ml_refresh_token WHERE user_id = %s", (row[0],))
+        if row is None:
+            return False
+        logger.info(f"Password updated for user: {email}")
+        return True
     except Exception as e:
         logger.error(f"Error updating password for {email}: {e}")
         return False
 
 
+def rehash_user_password(email: str, pwd: str, old_hash: str) -> bool:
+    """Re-hash a just-verified password at the current cost; unlike a reset, sessions stay valid."""
+    try:
+        new_hash = hash_password(pwd)
+        with db_cursor(autocommit=True) as cur:
+            # Only replaces the hash it was verified against, so a concurrent password change wins
+            cur.execute(
+                "UPDATE ml_user SET pwd=%s WHERE email=%s AND pwd=%s RETURNING id",
+                (new_hash, email, old_hash)
+            )
+            row = cur.fetchone()
+        if row is not None:
+            logger.info(f"Password hash upgraded for user: {email}")
+        return row is not None
+    except Exception as e:
+        logger.error(f"Error re-hashing password for {email}: {e}")
+        return False
+
+
 def update_user_tokens(email: str, new_tokens: int) -> bool:
     try:
-        conn = get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE ml_user SET tokens=%s WHERE email=%s RETURNING id",
-                    (new_tokens, email)
-                )
-                updated = cur.rowcount
-                conn.commit()
-                return updated > 0
-        except Exception as e:
-            conn.rollback()
-            raise
-        finally:
-            return_connection(conn)
+        with db_cursor() as cur:
+            cur.execute(
+                "UPDATE ml_user SET tokens=%s WHERE email=%s RETURNING id",
+                (new_tokens, email)
+            )
+            row = cur.fetchone()
+        return row is not None
     except Exception as e:
         logger.error(f"Error updating tokens for {email}: {e}")
         return False
@@ -218,21 +230,13 @@ def update_user_tokens(email: str, new_tokens: int) -> bool:
 
 def refund_tokens(email: str, amount: int) -> bool:
     try:
-        conn = get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE ml_user SET tokens = tokens + %s WHERE email = %s RETURNING id",
-                    (amount, email)
-                )
-                updated = cur.rowcount
-                conn.commit()
-                return updated > 0
-        except Exception as e:
-            conn.rollback()
-            raise
-        finally:
-            return_connection(conn)
+        with db_cursor(autocommit=True) as cur:
+            cur.execute(
+                "UPDATE ml_user SET tokens = tokens + %s WHERE email = %s RETURNING id",
+                (amount, email)
+            )
+            row = cur.fetchone()
+        return row is not None
     except Exception as e:
         logger.error(f"Error refunding tokens for {email}: {e}")
         return False
@@ -240,73 +244,55 @@ def refund_tokens(email: str, amount: int) -> bool:
 
 def check_and_deduct_tokens(email: str, required_tokens: int) -> bool:
     try:
-        conn = get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE ml_user SET tokens = tokens - %s WHERE email = %s AND tokens >= %s RETURNING id, tokens",
-                    (required_tokens, email, required_tokens)
-                )
-                row = cur.fetchone()
-                conn.commit()
-                if row is None:
-                    current = get_user_tokens(email)
-                    if current is None:
-                        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-                    raise HTTPException(
-                        status_code=status.HTTP_402_PAYMENT_REQUIRED,
-                        detail=f"Insufficient tokens. Required: {required_tokens}, Available: {current}"
-                    )
-                logger.info(f"User {email}: Deducted {required_tokens} tokens. Remaining: {row[1]}")
-                return True
-        except HTTPException:
-            raise
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"Token deduction failed for {email}: {e}")
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to update tokens")
-        finally:
-            return_connection(conn)
-    except HTTPException:
-        raise
+        with db_cursor(autocommit=True) as cur:
+            # One round trip: the conditional UPDATE deducts, and the outer SELECT reports the
+            # balance it saw, so a failed deduction can tell "no such user" from "not enough tokens"
+            execute_prepared(cur, "deduct_user_tokens", _DEDUCT_TOKENS_PREPARED, (email, required_tokens))
+            row = cur.fetchone()
     except Exception as e:
-        logger.error(f"Error in check_and_deduct_tokens for {email}: {e}")
+        logger.error(f"Token deduction failed for {email}: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to update tokens")
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    available, remaining = row
+    if remaining is None:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=f"Insufficient tokens. Required: {required_tokens}, Available: {available}"
+        )
+    logger.info(f"User {email}: Deducted {required_tokens} tokens. Remaining: {remaining}")
+    return True
 
 
 def is_user_admin(email: str) -> bool:
+    if _admin_cache.get(email):
+        return True
     try:
-        conn = get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT is_admin FROM ml_user WHERE email=%s", (email,))
-                row = cur.fetchone()
-                if row:
-                    return bool(row[0])
-                return False
-        finally:
-            return_connection(conn)
+        with db_cursor(autocommit=True) as cur:
+            execute_prepared(cur, "select_user_is_admin", _SELECT_IS_ADMIN_PREPARED, (email,))
+            row = cur.fetchone()
+        if row and row[0]:
+            _admin_cache.set(email, True)
+            return True
+        return False
     except Exception as e:
         logger.error(f"Error checking admin status for {email}: {e}")
         return False
 
 
-def get_all_users(min_tokens: Optional[int] = None) -> list:
+def get_all_users(min_tokens: Optional[int] = None, after_id: int = 0, limit: Optional[int] = None) -> list:
+    """Users ordered by id; pass the last id seen as after_id to fetch the next page of at most limit rows."""
     try:
-        conn = get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                if min_tokens is not None:
-                    cur.execute(
-                        "SELECT id, email, tokens, is_admin FROM ml_user WHERE tokens >= %s ORDER BY id",
-                        (min_tokens,)
-                    )
-                else:
-                    cur.execute("SELECT id, email, tokens, is_admin FROM ml_user ORDER BY id")
-                users = cur.fetchall()
-                return [dict(user) for user in users]
-        finally:
-            return_connection(conn)
+        with db_cursor(autocommit=True) as cur:
+            # Keyset paging walks the primary key index, so a deep page costs the same as the first
+            cur.execute(
+                "SELECT id, email, tokens, is_admin FROM ml_user "
+                "WHERE id > %s AND (%s::int IS NULL OR tokens >= %s) ORDER BY id LIMIT %s",
+                (after_id, min_tokens, min_tokens, limit)
+            )
+            rows = cur.fetchall()
+        # Tuple rows zipped onto fixed keys skip the per-row dict building RealDictCursor does in Python
+        return [dict(zip(_USER_LIST_COLUMNS, row)) for row in rows]
     except Exception as e:
         logger.error(f"Error fetching all users: {e}")
         return []
@@ -315,26 +301,47 @@ def get_all_users(min_tokens: Optional[int] = None) -> list:
 def add_tokens_to_user(email: str, amount: int) -> bool:
     """Add tokens atomically (tokens = tokens + amount in a single UPDATE)."""
     try:
-        conn = get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE ml_user SET tokens = tokens + %s WHERE email = %s RETURNING id, tokens",
-                    (amount, email)
-                )
-                row = cur.fetchone()
-                conn.commit()
-                if row is None:
-                    logger.warning(f"User not found: {email}")
-                    return False
-                logger.info(f"Added {amount} tokens to {email}. New balance: {row[1]}")
-                return True
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"Error adding tokens to {email}: {e}")
-            raise
-        finally:
-            return_connection(conn)
+        with db_cursor(autocommit=True) as cur:
+            cur.execute(
+                "UPDATE ml_user SET tokens = tokens + %s WHERE email = %s RETURNING id, tokens",
+                (amount, email)
+            )
+            row = cur.fetchone()
+        if row is None:
+            logger.warning(f"User not found: {email}")
+            return False
+        logger.info(f"Added {amount} tokens to {email}. New balance: {row[1]}")
+        return True
     except Exception as e:
         logger.error(f"Error adding tokens to {email}: {e}")
         return False
+
+
+def issue_refresh_token(user_id: int) -> Optional[str]:
+    try:
+        with db_cursor() as cur:
+            return _insert_refresh_token(cur, user_id)
+    except Exception as e:
+        logger.error(f"Error issuing refresh token for user ID {user_id}: {e}")
+        return None
+
+
+def rotate_refresh_token(token: str) -> Optional[Tuple[str, str]]:
+    """Consume a refresh token and issue its replacement; returns (email, new_token), or None if invalid."""
+    try:
+        with db_cursor() as cur:
+            # Deleting first makes every token single-use, even under concurrent refreshes
+            cur.execute(
+                "DELETE FROM ml_refresh_token t USING ml_user u "
+                "WHERE t.token_hash = %s AND u.id = t.user_id "
+                "RETURNING u.id, u.email, t.expires_at > now()",
+                (_hash_refresh_token(token),)
+            )
+            row = cur.fetchone()
+            if row is None or not row[2]:
+                return None
+            user_id, email, _ = row
+            return email, _insert_refresh_token(cur, user_id)
+    except Exception as e:
+        logger.error(f"Error rotating refresh token: {e}")
+        return None
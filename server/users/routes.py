@@ -1,10 +1,26 @@
 import logging
+from typing import Any, Dict
 
-from fastapi import HTTPException, Depends, APIRouter, status
+from fastapi import BackgroundTasks, HTTPException, Depends, APIRouter, Request, status
 
+from server.db.connection import run_db
 from server.security.jwt_auth import create_jwt, get_current_user
-from server.users.models import UserCreateRequest, UserLoginRequest, UserDeleteRequest, UserPasswordUpdateRequest
-from server.users.repository import create_user, validate_user, delete_user, delete_user_by_id, get_user_tokens, get_user_id_by_email, update_user_password
+from server.config import LOGIN_LOCKOUT_SECONDS
+from server.security.login_throttle import is_login_blocked, record_login_failure, clear_login_failures
+from server.security.passwords import needs_rehash, run_kdf
+from server.users.models import UserCreateRequest, UserLoginRequest, UserDeleteRequest, UserPasswordUpdateRequest, RefreshTokenRequest
+from server.users.repository import (
+    create_user,
+    validate_user,
+    delete_user,
+    delete_user_by_id,
+    get_user_tokens,
+    get_user_id_by_email,
+    update_user_password,
+    rehash_user_password,
+    issue_refresh_token,
+    rotate_refresh_token
+)
 
 logger = logging.getLogger(__name__)
 
@@ -12,10 +28,10 @@ router = APIRouter(prefix="/user", tags=["users"])
 
 
 @router.post("/create")
-async def user_create(payload: UserCreateRequest):
-    email = str(payload.email)
+async def user_create(payload: UserCreateRequest) -> Dict[str, Any]:
+    email = payload.email
     logger.info(f"User creation attempt: {email}")
-    success = create_user(email, payload.pwd)
+    success = await run_kdf(create_user, email, payload.pwd)
     if not success:
         logger.warning(f"User creation failed: {email} (already exists or error)")
         raise HTTPException(
@@ -31,22 +47,58 @@ async def user_create(payload: UserCreateRequest):
 
 
 @router.post("/login")
-async def user_login(payload: UserLoginRequest):
-    email = str(payload.email)
+async def user_login(payload: UserLoginRequest, request: Request, background_tasks: BackgroundTasks) -> Dict[str, Any]:
+    email = payload.email
     logger.info(f"Login attempt: {email}")
-    user = validate_user(email, payload.pwd)
+    throttle_key = (email.lower(), request.client.host if request.client else "")
+    if is_login_blocked(throttle_key):
+        # Refused before bcrypt, so repeated guessing costs no hashing time
+        logger.warning(f"Login throttled: {email} from {throttle_key[1]} (too many failed attempts)")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts. Try again later.",
+            headers={"Retry-After": str(int(LOGIN_LOCKOUT_SECONDS))},
+        )
+    user = await run_kdf(validate_user, email, payload.pwd)
     if not user:
+        record_login_failure(throttle_key)
         logger.warning(f"Login failed: {email} (invalid credentials)")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    clear_login_failures(throttle_key)
+    if needs_rehash(user["pwd"]):
+        # Migrates hashes to a changed BCRYPT_ROUNDS after the response is sent
+        background_tasks.add_task(run_kdf, rehash_user_password, email, payload.pwd, user["pwd"])
     token = create_jwt(email)
+    refresh_token = await run_db(issue_refresh_token, user["id"])
     logger.info(f"Login successful: {email}")
     return {
         "status": "OK",
         "access_token": token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer"
+    }
+
+
+@router.post("/refresh")
+async def user_refresh(payload: RefreshTokenRequest) -> Dict[str, Any]:
+    rotated = await run_db(rotate_refresh_token, payload.refresh_token)
+    if rotated is None:
+        logger.warning("Token refresh failed: unknown, used or expired refresh token")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    email, refresh_token = rotated
+    logger.info(f"Token refreshed: {email}")
+    return {
+        "status": "OK",
+        "access_token": create_jwt(email),
+        "refresh_token": refresh_token,
         "token_type": "bearer"
     }
 
@@ -55,8 +107,8 @@ async def user_login(payload: UserLoginRequest):
 async def user_delete(
     payload: UserDeleteRequest,
     current_user: str = Depends(get_current_user)
-):
-    authenticated_user_id = get_user_id_by_email(current_user)
+) -> Dict[str, Any]:
+    authenticated_user_id = await run_db(get_user_id_by_email, current_user)
     if authenticated_user_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -70,7 +122,7 @@ async def user_delete(
         )
     
     logger.info(f"User deletion request: {current_user} (ID: {authenticated_user_id}) attempting to delete user ID {payload.user_id}")
-    success = delete_user_by_id(payload.user_id)
+    success = await run_db(delete_user_by_id, payload.user_id)
     if not success:
         logger.warning(f"User deletion failed: User ID {payload.user_id} not found")
         raise HTTPException(
@@ -82,8 +134,8 @@ async def user_delete(
 
 
 @router.get("/tokens")
-async def get_tokens(current_user: str = Depends(get_current_user)):
-    tokens = get_user_tokens(current_user)
+async def get_tokens(current_user: str = Depends(get_current_user)) -> Dict[str, Any]:
+    tokens = await run_db(get_user_tokens, current_user)
     if tokens is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -96,8 +148,8 @@ async def get_tokens(current_user: str = Depends(get_current_user)):
 async def reset_password(
     payload: UserPasswordUpdateRequest,
     current_user: str = Depends(get_current_user)
-):
-    email = str(payload.email)
+) -> Dict[str, Any]:
+    email = payload.email
     if email.lower() != current_user.lower():
         logger.warning(f"Password reset denied: {current_user} attempted to reset password for {email}")
         raise HTTPException(
@@ -105,13 +157,13 @@ async def reset_password(
             detail="You can only reset your own password. Email must match your account."
         )
     logger.info(f"Password reset attempt for: {email}")
-    user_id = get_user_id_by_email(current_user)
+    user_id = await run_db(get_user_id_by_email, current_user)
     if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-    success = update_user_password(email, payload.new_password)
+    success = await run_kdf(update_user_password, email, payload.new_password)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -0,0 +1,4 @@
+import os
+
+# server.config refuses to import without a signing key; tests never talk to a database
+os.environ.setdefault("JWT_SECRET", "test-secret-key-for-unit-tests-only")
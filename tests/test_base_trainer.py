@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from server.ml.random_forest_model import RandomForestModel
+
+
+class PredictColumnOrderTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.trainer = RandomForestModel(model_name="rf_column_order", n_estimators=5)
+        self.trainer.train_dir = self._tmp.name
+        self.trainer.metrics_dir = self._tmp.name
+        df = pd.DataFrame({
+            "a": [0.1 * i for i in range(20)],
+            "b": [0.2 * i for i in range(20)],
+            "y": [float(i) for i in range(20)],
+        })
+        self.trainer.train(df, ["a", "b"], "y")
+
+    def test_reordered_features_predict_the_same(self):
+        expected = self.trainer.predict({"a": 0.1, "b": 0.2})
+        self.assertEqual(self.trainer.predict({"b": 0.2, "a": 0.1}), expected)
+
+    def test_extra_features_are_ignored(self):
+        expected = self.trainer.predict({"a": 0.1, "b": 0.2})
+        self.assertEqual(self.trainer.predict({"c": 0.3, "b": 0.2, "a": 0.1}), expected)
+
+    def test_missing_features_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.trainer.predict({"a": 0.1})
+
+
+class SavedModelPermissionsTest(unittest.TestCase):
+    @unittest.skipIf(os.name == "nt", "POSIX file modes")
+    def test_model_file_gets_the_same_mode_as_the_metrics_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            trainer = RandomForestModel(model_name="rf_mode", n_estimators=3)
+            trainer.train_dir = tmp
+            trainer.metrics_dir = tmp
+            trainer.train(pd.DataFrame({"a": range(10), "y": range(10)}), ["a"], "y")
+            model_mode = os.stat(os.path.join(tmp, "rf_mode.pkl")).st_mode & 0o777
+            metrics_mode = os.stat(os.path.join(tmp, "rf_mode_metrics.json")).st_mode & 0o777
+            self.assertEqual(model_mode, metrics_mode)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import tempfile
+import unittest
+
+import pandas as pd
+
+from server.ml.linear_regression_model import LinearRegressionModel
+
+
+class LinearFastPathTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.trainer = LinearRegressionModel(model_name="lr_fast_path")
+        self.trainer.train_dir = self._tmp.name
+        self.trainer.metrics_dir = self._tmp.name
+        df = pd.DataFrame({
+            "a": [float(i) for i in range(20)],
+            "b": [float(i % 5) for i in range(20)],
+            "y": [2.0 * i + (i % 5) for i in range(20)],
+        })
+        self.trainer.train(df, ["a", "b"], "y")
+
+    def test_missing_value_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.trainer.predict({"a": 1.0, "b": None})
+        with self.assertRaises(ValueError):
+            self.trainer.predict_batch([{"a": 1.0, "b": 2.0}, {"a": None, "b": 2.0}])
+
+    def test_extra_features_are_ignored(self):
+        expected = self.trainer.predict({"a": 1.0, "b": 2.0})
+        self.assertEqual(self.trainer.predict({"b": 2.0, "a": 1.0, "c": 9.0}), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from unittest import mock
+
+import bcrypt
+
+from server.security import passwords
+
+
+def _hash_with_cost(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+
+class NeedsRehashTest(unittest.TestCase):
+    def test_higher_cost_hash_is_not_downgraded(self):
+        stored = _hash_with_cost("secret", 12)
+        with mock.patch.object(passwords, "BCRYPT_ROUNDS", 10):
+            self.assertFalse(passwords.needs_rehash(stored))
+
+    def test_same_cost_hash_is_kept(self):
+        stored = _hash_with_cost("secret", 10)
+        with mock.patch.object(passwords, "BCRYPT_ROUNDS", 10):
+            self.assertFalse(passwords.needs_rehash(stored))
+
+    def test_lower_cost_hash_is_upgraded(self):
+        stored = _hash_with_cost("secret", 4)
+        with mock.patch.object(passwords, "BCRYPT_ROUNDS", 10):
+            self.assertTrue(passwords.needs_rehash(stored))
+
+    def test_malformed_hash_is_ignored(self):
+        with mock.patch.object(passwords, "BCRYPT_ROUNDS", 10):
+            self.assertFalse(passwords.needs_rehash("$2b$04$short"))
+            self.assertFalse(passwords.needs_rehash(""))
+
+
+if __name__ == "__main__":
+    unittest.main()